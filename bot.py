@@ -1,14 +1,187 @@
 import asyncio
-import json
+import html
+import logging
+import multiprocessing
+import random
 import re
-import requests
-from bs4 import BeautifulSoup
-from telegram import Bot, Update
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging.handlers import RotatingFileHandler
+import aiohttp
+import orjson
+from selectolax.lexbor import LexborHTMLParser
+from telegram import Bot, LinkPreviewOptions, Update
 import yaml
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 
+log = logging.getLogger('matcha')
+
+def setup_logging(log_config):
+    """Configure the bot logger from the `logging` section of config.yaml"""
+    log.setLevel(log_config.get('level', 'INFO'))
+    
+    # Write to a rotating file when configured, otherwise to stdout (journald on the Pi)
+    if log_config.get('file'):
+        handler = RotatingFileHandler(
+            log_config['file'],
+            maxBytes=log_config.get('max_bytes', 1_000_000),
+            backupCount=log_config.get('backup_count', 3),
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+    log.handlers[:] = [handler]
+    log.propagate = False
+
+# Collapses runs of whitespace in the product stock status text
+_WS_RE = re.compile(r'\s+')
+
+# Raw-byte patterns for the fast path in _fast_stock_status
+_TITLE_RE = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+_OOS_RE = re.compile(rb'<div[^>]*\sid="oos-container"[^>]*>(.*?)</div>', re.DOTALL)
+# Class names are matched as whole whitespace-separated tokens (\b would accept
+# "sticky-add-button-container" or "product-stock-status-label")
+_CONTAINER_RE = re.compile(rb'<div[^>]*\sclass="(?:[^"]*\s)?add-button-container(?:\s[^"]*)?"[^>]*>')
+# Only a plain-text status span directly after the container's opening tag
+_STATUS_SPAN_RE = re.compile(rb'\s*<span[^>]*\sclass="(?:[^"]*\s)?product-stock-status(?:\s[^"]*)?"[^>]*>([^<]*)</span>')
+_TAG_RE = re.compile(rb'<[^>]*>')
+
+# Check errors that mean the product page is gone rather than temporarily unreachable
+_PERSISTENT_ERROR_RE = re.compile(r'not found|404|removed', re.IGNORECASE)
+
+# Stock notification templates (out of stock emphasizes the restocking message)
+_STOCK_UPDATE_HEADER = "🍵 *Matcha Stock Update*\n\n"
+_IN_STOCK_TMPL = (
+    "*{name}*\n"
+    "Status: 🟢 In Stock\n"
+    "Details: {msg}\n\n"
+    "Check it out: {url}"
+)
+_OUT_OF_STOCK_TMPL = (
+    "*{name}*\n"
+    "Status: 🔴 Out of Stock\n"
+    "📢 *Restocking Info:* {msg}\n\n"
+    "Check it out: {url}"
+)
+
+# Stock updates already carry the product link; skip Telegram's preview fetch
+_NO_LINK_PREVIEW = LinkPreviewOptions(is_disabled=True)
+
+def _oos_result(oos_message):
+    """Result for a page with an out-of-stock container"""
+    if oos_message:
+        return False, f"Out of stock: {oos_message}"
+    return False, "Out of stock (oos-container found)"
+
+def _status_text_result(status_text):
+    """Result for the text of the product stock status span"""
+    status_normalized = _WS_RE.sub(' ', status_text.lower()).strip()
+    
+    if 'sold out' in status_normalized:
+        return False, f"Out of stock ({status_text})"
+    elif 'add to bag' in status_normalized:
+        return True, f"In stock ({status_text})"
+    else:
+        return None, f"Unknown status ({status_text})"
+
+def _in_raw_text(raw, pos):
+    """Whether pos falls inside a <script>, <style> or comment, where tags aren't markup"""
+    for start, end in ((b'<script', b'</script'), (b'<style', b'</style'), (b'<!--', b'-->')):
+        if raw.rfind(start, 0, pos) > raw.rfind(end, 0, pos):
+            return True
+    return False
+
+def _fast_stock_status(raw):
+    """Read the stock status straight from the raw page bytes.
+    
+    Returns None whenever the markup isn't exactly what we expect, so the
+    caller can fall back to a full HTML parse.
+    """
+    # Leave error pages to the full parse
+    title = _TITLE_RE.search(raw)
+    if title is None:
+        return None
+    title_text = title.group(1).lower()
+    if b'404' in title_text or b'not found' in title_text or b'error' in title_text:
+        return None
+    
+    # Out-of-stock container (only when it has no nested divs)
+    if b'oos-container' in raw:
+        match = _OOS_RE.search(raw)
+        if match is None or b'<div' in match.group(1) or _in_raw_text(raw, match.start()):
+            return None
+        parts = _TAG_RE.split(match.group(1))
+        oos_message = ''.join(html.unescape(part.decode('utf-8', 'replace')).strip() for part in parts)
+        return _oos_result(oos_message)
+    
+    # Stock status span opening the first add button container; anything else
+    # (nested markup, a span elsewhere on the page) is left to the full parse
+    container = _CONTAINER_RE.search(raw)
+    if container is None or _in_raw_text(raw, container.start()):
+        return None
+    match = _STATUS_SPAN_RE.match(raw, container.end())
+    if match is None:
+        return None
+    status_text = html.unescape(match.group(1).decode('utf-8', 'replace')).strip()
+    return _status_text_result(status_text)
+
+def _parse_product_page(content):
+    """Work out the stock status from a product page's full HTML parse"""
+    tree = LexborHTMLParser(content)
+    
+    # Check if page looks like a product page (basic validation)
+    page_title = tree.css_first('title')
+    if page_title is not None:
+        title_text = page_title.text().lower()
+        if '404' in title_text or 'not found' in title_text or 'error' in title_text:
+            return None, f"Product page not found - Page title indicates error"
+    
+    # Check for out-of-stock container
+    oos_container = tree.css_first('div#oos-container')
+    if oos_container is not None:
+        # Extract OOS message if available
+        return _oos_result(oos_container.text(strip=True))
+    
+    # Check the add button container
+    add_button_container = tree.css_first('div.add-button-container')
+    if add_button_container is not None:
+        stock_status_span = add_button_container.css_first('span.product-stock-status')
+        if stock_status_span is not None:
+            return _status_text_result(stock_status_span.text(strip=True))
+        else:
+            return None, "No stock status span found"
+    else:
+        return None, "No add button container found"
+
+class TokenBucket:
+    """Async token bucket allowing `rate` acquisitions per second"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def consume(self):
+        """Wait until a token is available and take it"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
 class NeedMoMatchaBot:
     def __init__(self, config_path="config.yaml"):
         # Load environment variables
@@ -17,6 +190,7 @@ class NeedMoMatchaBot:
         # Load configuration
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
+        setup_logging(self.config.get('logging', {}))
         
         # Get Telegram token from environment variable
         telegram_token = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -26,85 +200,391 @@ class NeedMoMatchaBot:
         # Initialize bot
         self.bot = Bot(token=telegram_token)
         
-        # Create directories if they don't exist
-        os.makedirs('users', exist_ok=True)
-        os.makedirs('stock_status', exist_ok=True)
+        # Shared HTTP session for product checks (reuses connections across checks)
+        self.http = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.config['monitoring']['timeout']),
+            connector=aiohttp.TCPConnector(limit_per_host=8, ttl_dns_cache=300)
+        )
+        self.fetch_semaphore = asyncio.Semaphore(self.config['monitoring'].get('max_concurrency', 10))
+        
+        # Full HTML parses run in worker processes to keep the event loop free
+        self._parse_pool = self._new_parse_pool()
+        
+        # Conditional GET validators and the result they correspond to, per product
+        self._http_cache = {}  # product_id -> {'url', 'etag', 'last_modified', 'result'}
+        self._retry_after = {}  # url -> seconds the website asked us to wait (429/503)
+        
+        # Failed monitoring cycles in a row, for backing off the loop
+        self._consecutive_errors = 0
+        
+        # Open the state database (users, stock status and bot states). Stock status
+        # is saved from a worker thread, so writes are serialized with _db_lock.
+        self._db_lock = threading.Lock()
+        self.db = self.open_database('state.db')
+        self.import_legacy_files()
         
         # Load all users
         self.users = self.load_users()
+        self._invert_index()
         
         # Development mode - only send to specific user (you)
         self.dev_mode = self.config.get('development', {}).get('enabled', False)
         self.dev_user_id = os.getenv('DEV_USER_ID') or self.config.get('development', {}).get('dev_user_id', None)
         
+        # Adaptive polling: a product's interval halves when its status changes and
+        # doubles while it stays the same, within [check_interval, max_interval]
+        self.min_interval = self.config['monitoring']['check_interval']
+        self.max_interval = self.config['monitoring'].get('max_interval', self.min_interval * 4)
+        self._poll_intervals = {}  # product_id -> current interval in seconds
+        self._next_check = {}  # product_id -> time.monotonic() when the product is next due
+        self._last_seen = {}  # product_id -> last valid (in_stock, message)
+        
+        # In-memory stock status per user; changed rows are written back once per cycle
+        self._status_cache = self.get_all_stock_statuses()
+        self._dirty_statuses = {}  # chat_id -> {product_id: status} awaiting save
+        
         # Track bot state per user to prevent duplicate notifications
         self.user_bot_states = self.load_bot_states()  # 'maintenance' or 'resumed' per user
         
-        print(f"🤖 Bot initialized")
-        print(f"👥 Loaded {len(self.users)} users")
-        print(f"📋 Available products: {len(self.config['available_products'])}")
+        # Stock notifications are queued per user during a cycle and sent as one
+        # message before that cycle's statuses are saved
+        notification_config = self.config.get('notifications', {})
+        self._pending_notifs = {}  # chat_id -> [(product_name, formatted update text)]
+        
+        # Timestamp string shared by writes within the same second
+        self._now_iso_cache = None
+        self._now_iso_at = 0.0
+        
+        # Keep Telegram sends under the bot API limits (30 msg/s globally)
+        self._inflight = asyncio.BoundedSemaphore(notification_config.get('max_concurrent_sends', 25))
+        self._bucket = TokenBucket(notification_config.get('max_messages_per_second', 30))
+        
+        # Static parts of the /list reply, ordered by website layout (RICH, MEDIUM, LIGHT)
+        self._list_product_order = [
+            'ummon_40g', 'ummon_20g',  # RICH
+            'sayaka_100g', 'sayaka_40g', 'horai_20g',  # RICH
+            'kan_30g',  # MEDIUM
+            'ikuyo_100g', 'ikuyo_30g',  # MEDIUM
+            'wakaki_40g'  # LIGHT
+        ]
+        self._list_base_lines = [
+            (product_id, f" `{product_id}` - {self.config['available_products'][product_id]['name']}\n")
+            for product_id in self._list_product_order
+            if product_id in self.config['available_products']
+        ]
+        self._list_footer = (
+            "\n*Legend:*\n"
+            "✅ = Currently being monitored\n"
+            "❌ = Not being monitored\n\n"
+            "*To add a product:* `/add <product_id>`\n"
+            "*To remove a product:* `/remove <product_id>`"
+        )
+        
+        # Telegram command dispatch table
+        self._cmds = {
+            '/start': self._cmd_start,
+            '/list': self._cmd_list,
+            '/status': self._cmd_status,
+            '/add': self._cmd_add,
+            '/remove': self._cmd_remove,
+            '/default': self._cmd_default,
+            '/help': self._cmd_help,
+        }
+        
+        log.info("🤖 Bot initialized")
+        log.info("👥 Loaded %s users", len(self.users))
+        log.info("📋 Available products: %s", len(self.config['available_products']))
         if self.dev_mode:
-            print(f"🔧 Development mode enabled - only sending to user {self.dev_user_id}")
+            log.info("🔧 Development mode enabled - only sending to user %s", self.dev_user_id)
+    
+    def open_database(self, path):
+        """Open the SQLite state database and create tables if needed"""
+        db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                chat_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stock_status (
+                chat_id TEXT NOT NULL,
+                product_id TEXT NOT NULL,
+                in_stock INTEGER,
+                message TEXT,
+                error_time REAL,
+                updated_at REAL,
+                PRIMARY KEY (chat_id, product_id)
+            );
+            CREATE TABLE IF NOT EXISTS bot_states (
+                chat_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        return db
+    
+    def import_legacy_files(self):
+        """Import the old JSON files once, then mark the database as migrated"""
+        (version,) = self.db.execute('PRAGMA user_version').fetchone()
+        if version < 1:
+            self._import_legacy_json()
+    
+    def _import_legacy_json(self):
+        """Import users, stock status and bot states from the old JSON files.
+        
+        The version marker is set in the same transaction as the import.
+        """
+        users = {}
+        if os.path.exists('users'):
+            with os.scandir('users') as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith('.json'):
+                        chat_id = entry.name.replace('user_', '').replace('.json', '')
+                        try:
+                            with open(entry.path, 'rb') as f:
+                                users[chat_id] = orjson.loads(f.read())
+                        except Exception as e:
+                            log.warning("⚠️ Error loading user %s: %s", chat_id, e)
+        
+        stock_rows = []
+        for chat_id in users:
+            try:
+                with open(f'stock_status/user_{chat_id}.json', 'rb') as f:
+                    data = orjson.loads(f.read())
+            except FileNotFoundError:
+                continue
+            
+            # Error timestamps were stored as separate '<product_id>_error_time' keys
+            statuses = {}
+            for key, value in data.items():
+                if key.endswith('_error_time'):
+                    statuses.setdefault(key[:-len('_error_time')], {})['error_time'] = value
+                elif isinstance(value, bool):
+                    # Handle legacy format
+                    statuses.setdefault(key, {}).update(in_stock=value, message='Legacy status')
+                else:
+                    statuses.setdefault(key, {}).update(value)
+            
+            for product_id, status in statuses.items():
+                stock_rows.append((
+                    chat_id, product_id,
+                    status.get('in_stock'), status.get('message'), status.get('error_time')
+                ))
+        
+        try:
+            with open('bot_states.json', 'rb') as f:
+                bot_states = orjson.loads(f.read())
+        except FileNotFoundError:
+            bot_states = {}
+        
+        with self.db:
+            self.db.execute('BEGIN')
+            self.db.executemany(
+                'INSERT OR REPLACE INTO users (chat_id, data) VALUES (?, ?)',
+                [(chat_id, orjson.dumps(data).decode()) for chat_id, data in users.items()]
+            )
+            self.db.executemany(
+                'INSERT OR REPLACE INTO stock_status (chat_id, product_id, in_stock, message, error_time) '
+                'VALUES (?, ?, ?, ?, ?)',
+                stock_rows
+            )
+            self.db.executemany(
+                'INSERT OR REPLACE INTO bot_states (chat_id, state) VALUES (?, ?)',
+                list(bot_states.items())
+            )
+            self.db.execute('PRAGMA user_version = 1')
+        
+        if users:
+            log.info("📦 Imported %s users from legacy JSON files into the database", len(users))
     
     def load_users(self):
         """Load all user configurations"""
         users = {}
-        if os.path.exists('users'):
-            for filename in os.listdir('users'):
-                if filename.endswith('.json'):
-                    chat_id = filename.replace('user_', '').replace('.json', '')
-                    try:
-                        with open(f'users/{filename}', 'r') as f:
-                            user_data = json.load(f)
-                            users[chat_id] = user_data
-                    except Exception as e:
-                        print(f"⚠️ Error loading user {chat_id}: {e}")
+        for chat_id, data in self.db.execute('SELECT chat_id, data FROM users'):
+            try:
+                users[chat_id] = orjson.loads(data)
+            except Exception as e:
+                log.warning("⚠️ Error loading user %s: %s", chat_id, e)
         return users
     
     def save_user(self, chat_id, user_data):
         """Save user configuration"""
-        filename = f'users/user_{chat_id}.json'
-        with open(filename, 'w') as f:
-            json.dump(user_data, f, indent=2)
+        with self._db_lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO users (chat_id, data) VALUES (?, ?)',
+                (chat_id, orjson.dumps(user_data).decode())
+            )
         self.users[chat_id] = user_data
     
+    @staticmethod
+    def _stock_status_from_row(in_stock, message, error_time):
+        """Convert a stock_status row into the in-memory status dict"""
+        status = {}
+        if in_stock is not None:
+            status['in_stock'] = bool(in_stock)
+            status['message'] = message
+        if error_time is not None:
+            status['error_time'] = error_time
+        return status
+    
     def get_user_stock_status(self, chat_id):
         """Get stock status for a specific user"""
-        filename = f'stock_status/user_{chat_id}.json'
-        try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-                # Handle legacy format
-                for product_id in data:
-                    if isinstance(data[product_id], bool):
-                        data[product_id] = {
-                            'in_stock': data[product_id],
-                            'message': 'Legacy status'
-                        }
-                return data
-        except FileNotFoundError:
-            return {}
+        rows = self.db.execute(
+            'SELECT product_id, in_stock, message, error_time FROM stock_status WHERE chat_id = ?',
+            (chat_id,)
+        )
+        return {
+            product_id: self._stock_status_from_row(in_stock, message, error_time)
+            for product_id, in_stock, message, error_time in rows
+        }
+    
+    def get_all_stock_statuses(self):
+        """Get stock status for every user in a single query"""
+        statuses = {}
+        rows = self.db.execute(
+            'SELECT chat_id, product_id, in_stock, message, error_time FROM stock_status'
+        )
+        for chat_id, product_id, in_stock, message, error_time in rows:
+            statuses.setdefault(chat_id, {})[product_id] = self._stock_status_from_row(
+                in_stock, message, error_time
+            )
+        return statuses
+    
+    @staticmethod
+    def _stock_status_rows(statuses):
+        """Flatten {chat_id: {product_id: status}} into stock_status rows"""
+        updated_at = time.time()
+        return [
+            (chat_id, product_id,
+             status.get('in_stock'), status.get('message'), status.get('error_time'),
+             updated_at)
+            for chat_id, stock_status in statuses.items()
+            for product_id, status in stock_status.items()
+        ]
+    
+    def _write_stock_status_rows(self, rows):
+        """Write stock_status rows in a single transaction (safe to call from a worker thread)"""
+        with self._db_lock, self.db:
+            self.db.execute('BEGIN')
+            self.db.executemany(
+                'INSERT OR REPLACE INTO stock_status '
+                '(chat_id, product_id, in_stock, message, error_time, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+    
+    def save_stock_statuses(self, statuses):
+        """Save the given {chat_id: {product_id: status}} rows in a single transaction"""
+        self._write_stock_status_rows(self._stock_status_rows(statuses))
     
     def save_user_stock_status(self, chat_id, stock_status):
         """Save stock status for a specific user"""
-        filename = f'stock_status/user_{chat_id}.json'
-        with open(filename, 'w') as f:
-            json.dump(stock_status, f, indent=2)
+        self.save_stock_statuses({chat_id: stock_status})
+    
+    def cached_stock_status(self, chat_id):
+        """Get a user's stock status from the in-memory cache, loading it on first use"""
+        if chat_id not in self._status_cache:
+            self._status_cache[chat_id] = self.get_user_stock_status(chat_id)
+        return self._status_cache[chat_id]
+    
+    def invalidate_stock_status(self, chat_id):
+        """Drop a user's cached stock status, saving any unsaved changes first"""
+        if chat_id in self._dirty_statuses:
+            self.save_user_stock_status(chat_id, self._dirty_statuses.pop(chat_id))
+        self._status_cache.pop(chat_id, None)
+    
+    async def save_dirty_stock_statuses(self):
+        """Write back every cached stock status row changed since the last save.
+        
+        The rows are built on the event loop (the monitor loop keeps mutating the
+        cached dicts) and written from a worker thread so disk stalls don't block it.
+        If the caller is cancelled mid-write (shutdown), the rows are queued again so
+        the final save writes them even if the worker thread never gets to.
+        """
+        dirty_statuses, self._dirty_statuses = self._dirty_statuses, {}
+        if dirty_statuses:
+            rows = self._stock_status_rows(dirty_statuses)
+            try:
+                await asyncio.to_thread(self._write_stock_status_rows, rows)
+            except asyncio.CancelledError:
+                for chat_id, stock_status in dirty_statuses.items():
+                    pending = self._dirty_statuses.setdefault(chat_id, {})
+                    for product_id, status in stock_status.items():
+                        pending.setdefault(product_id, status)
+                raise
+    
+    def close_database(self):
+        """Close the state database once any write still running in a worker thread has finished"""
+        with self._db_lock:
+            self.db.close()
     
     def load_bot_states(self):
         """Load bot states for all users"""
-        filename = 'bot_states.json'
-        try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+        return dict(self.db.execute('SELECT chat_id, state FROM bot_states'))
+    
+    def save_bot_states(self, chat_ids):
+        """Save bot states for the given users in a single transaction"""
+        with self._db_lock, self.db:
+            self.db.execute('BEGIN')
+            self.db.executemany(
+                'INSERT OR REPLACE INTO bot_states (chat_id, state) VALUES (?, ?)',
+                [(chat_id, self.user_bot_states[chat_id]) for chat_id in chat_ids]
+            )
+    
+    def _invert_index(self):
+        """Build the product_id -> {chat_id} index from user preferences.
+        
+        Only products in the config are indexed, so the index keys are exactly
+        the set of products the monitoring loop has to check.
+        """
+        self.product_subscribers = {}
+        unknown = set()
+        for chat_id, user_data in self.users.items():
+            for product_id in user_data.get('monitored_products', []):
+                if product_id in self.config['available_products']:
+                    self.product_subscribers.setdefault(product_id, set()).add(chat_id)
+                else:
+                    unknown.add(product_id)
+        
+        if unknown:
+            log.warning("⚠️ Ignoring monitored products missing from config.yaml: %s", ", ".join(sorted(unknown)))
+    
+    def _update_subscriptions(self, chat_id, monitored_products):
+        """Bring one user's entries in the product index up to date"""
+        monitored = {p for p in monitored_products if p in self.config['available_products']}
+        for product_id in [p for p, subscribers in self.product_subscribers.items()
+                           if chat_id in subscribers and p not in monitored]:
+            self.product_subscribers[product_id].discard(chat_id)
+            if not self.product_subscribers[product_id]:
+                del self.product_subscribers[product_id]
+        for product_id in monitored:
+            self.product_subscribers.setdefault(product_id, set()).add(chat_id)
     
-    def save_bot_states(self):
-        """Save bot states for all users"""
-        filename = 'bot_states.json'
-        with open(filename, 'w') as f:
-            json.dump(self.user_bot_states, f, indent=2)
+    @property
+    def _now_iso(self):
+        """Current time as an ISO string, refreshed at most once per second"""
+        now = time.time()
+        if now - self._now_iso_at >= 1:
+            self._now_iso_cache = datetime.fromtimestamp(now).isoformat()
+            self._now_iso_at = now
+        return self._now_iso_cache
+    
+    def load_telegram_offset(self):
+        """Load the next Telegram update offset saved by the previous run"""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'telegram_offset'").fetchone()
+        return int(row[0]) if row else 0
+    
+    def save_telegram_offset(self, offset):
+        """Save the next Telegram update offset so restarts don't redeliver updates"""
+        with self._db_lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('telegram_offset', ?)",
+                (str(offset),)
+            )
     
     def add_user(self, chat_id, name="Unknown User"):
         """Add a new user with default preferences"""
@@ -113,11 +593,12 @@ class NeedMoMatchaBot:
                 "chat_id": chat_id,
                 "name": name,
                 "monitored_products": ["ikuyo_100g"],  # Default
-                "created_at": datetime.now().isoformat(),
-                "last_active": datetime.now().isoformat()
+                "created_at": self._now_iso,
+                "last_active": self._now_iso
             }
             self.save_user(chat_id, user_data)
-            print(f"✅ Added new user: {name} ({chat_id})")
+            self._update_subscriptions(chat_id, user_data["monitored_products"])
+            log.info("✅ Added new user: %s (%s)", name, chat_id)
             return True
         return False
     
@@ -125,13 +606,18 @@ class NeedMoMatchaBot:
         """Update user's monitored products"""
         if chat_id in self.users:
             self.users[chat_id]["monitored_products"] = monitored_products
-            self.users[chat_id]["last_active"] = datetime.now().isoformat()
+            self.users[chat_id]["last_active"] = self._now_iso
             self.save_user(chat_id, self.users[chat_id])
+            self._update_subscriptions(chat_id, monitored_products)
             return True
         return False
     
-    def should_send_notification(self, notification_type, chat_id=None):
-        """Check if we should send a notification based on bot state transitions"""
+    def should_send_notification(self, notification_type, chat_id=None, save=True):
+        """Check if we should send a notification based on bot state transitions
+        
+        Pass save=False when checking many users at once and persist the
+        transitioned users afterwards with a single save_bot_states call.
+        """
         if notification_type == "maintenance_start" or notification_type == "dev_mode_enabled":
             # Only send maintenance if user was previously in 'resumed' state
             current_state = self.user_bot_states.get(chat_id, 'resumed')  # Default to resumed
@@ -140,7 +626,8 @@ class NeedMoMatchaBot:
             else:
                 # Update state to maintenance
                 self.user_bot_states[chat_id] = 'maintenance'
-                self.save_bot_states()  # Save the updated state
+                if save:
+                    self.save_bot_states([chat_id])  # Save the updated state
                 return True
                 
         elif notification_type == "maintenance_end":
@@ -151,7 +638,8 @@ class NeedMoMatchaBot:
             else:
                 # Update state to resumed
                 self.user_bot_states[chat_id] = 'resumed'
-                self.save_bot_states()  # Save the updated state
+                if save:
+                    self.save_bot_states([chat_id])  # Save the updated state
                 return True
             
         elif notification_type == "unexpected_shutdown":
@@ -162,128 +650,193 @@ class NeedMoMatchaBot:
             # For other notifications, always send
             return True
     
-    def check_product_stock(self, product_id, product_config):
+    async def close(self):
+        """Close the shared HTTP session and the parse worker pool"""
+        await self.http.close()
+        self._parse_pool.shutdown()
+    
+    def _new_parse_pool(self):
+        """Create the worker pool for full HTML parses.
+        
+        The fast path handles most pages, so a worker or two is plenty. Workers are
+        never forked from this (threaded) process.
+        """
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        return ProcessPoolExecutor(
+            max_workers=self.config['monitoring'].get('parse_workers', 1),
+            mp_context=multiprocessing.get_context(start_method)
+        )
+    
+    async def parse_product_page(self, content):
+        """Run a full HTML parse in the worker pool, replacing the pool if a worker died"""
+        loop = asyncio.get_running_loop()
+        pool = self._parse_pool
+        try:
+            return await loop.run_in_executor(pool, _parse_product_page, content)
+        except BrokenProcessPool:
+            # A dead worker (e.g. OOM-killed) breaks the pool for good; concurrent
+            # parses may all land here, so only the first one replaces it
+            if self._parse_pool is pool:
+                log.warning("⚠️ Parse worker died - restarting the parse pool")
+                pool.shutdown(wait=False)
+                self._parse_pool = self._new_parse_pool()
+        
+        try:
+            return await loop.run_in_executor(self._parse_pool, _parse_product_page, content)
+        except BrokenProcessPool:
+            # Still broken; parse on a thread rather than lose this check
+            return await loop.run_in_executor(None, _parse_product_page, content)
+    
+    async def check_product_stock(self, product_id, product_config):
         """Check if a product is in stock using our proven logic"""
         try:
-            response = requests.get(
-                product_config['url'],
-                timeout=self.config['monitoring']['timeout'],
-                headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-            )
+            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+            
+            # Cached validators only apply to the URL they were fetched from
+            entry = self._http_cache.get(product_id)
+            if entry is not None and entry['url'] != product_config['url']:
+                del self._http_cache[product_id]
+                entry = None
+            if entry is not None:
+                if entry['etag']:
+                    headers['If-None-Match'] = entry['etag']
+                if entry['last_modified']:
+                    headers['If-Modified-Since'] = entry['last_modified']
+            
+            async with self.fetch_semaphore:
+                async with self.http.get(product_config['url'], headers=headers) as response:
+                    status_code = response.status
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+                    retry_after = response.headers.get('Retry-After')
+                    content = await response.read()
+            
+            # Honor the website's requested delay (only the delay-seconds form)
+            if status_code in (429, 503) and retry_after and retry_after.isdigit():
+                self._retry_after[product_config['url']] = int(retry_after)
+            
+            # Page unchanged since the last check - reuse the previous result
+            if status_code == 304 and entry is not None:
+                return entry['result']
             
             # Handle different HTTP status codes
-            if response.status_code == 404:
+            if status_code == 404:
                 return None, f"Product page not found (404) - Product may have been removed or URL changed"
-            elif response.status_code == 403:
+            elif status_code == 403:
                 return None, f"Access denied (403) - Website may be blocking requests"
-            elif response.status_code == 500:
+            elif status_code == 429:
+                return None, f"Rate limited (429) - Website asked us to slow down"
+            elif status_code == 500:
                 return None, f"Server error (500) - Website may be experiencing issues"
-            elif response.status_code != 200:
-                return None, f"HTTP {response.status_code} - Unexpected response from website"
-            
-            response.raise_for_status()
+            elif status_code != 200:
+                return None, f"HTTP {status_code} - Unexpected response from website"
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Most pages can be read without building a DOM
+            result = _fast_stock_status(content)
+            if result is None:
+                result = await self.parse_product_page(content)
             
-            # Check if page looks like a product page (basic validation)
-            page_title = soup.find('title')
-            if page_title:
-                title_text = page_title.get_text().lower()
-                if '404' in title_text or 'not found' in title_text or 'error' in title_text:
-                    return None, f"Product page not found - Page title indicates error"
-            
-            # Check for out-of-stock container
-            oos_container = soup.find('div', id='oos-container')
-            if oos_container:
-                # Extract OOS message if available
-                oos_message = oos_container.get_text(strip=True)
-                if oos_message:
-                    return False, f"Out of stock: {oos_message}"
-                else:
-                    return False, "Out of stock (oos-container found)"
-            
-            # Check the add button container
-            add_button_container = soup.find('div', class_='add-button-container')
-            if add_button_container:
-                stock_status_span = add_button_container.find('span', class_='product-stock-status')
-                if stock_status_span:
-                    status_text = stock_status_span.get_text(strip=True)
-                    status_normalized = re.sub(r'\s+', ' ', status_text.lower().strip())
-                    
-                    if 'sold out' in status_normalized:
-                        return False, f"Out of stock ({status_text})"
-                    elif 'add to bag' in status_normalized:
-                        return True, f"In stock ({status_text})"
-                    else:
-                        return None, f"Unknown status ({status_text})"
-                else:
-                    return None, "No stock status span found"
-            else:
-                return None, "No add button container found"
+            # Remember validators so the next check can be a conditional GET
+            self._http_cache[product_id] = {
+                'url': product_config['url'],
+                'etag': etag,
+                'last_modified': last_modified,
+                'result': result
+            }
+            return result
                 
-        except requests.exceptions.ConnectionError:
+        except aiohttp.ClientConnectionError:
             return None, f"Connection error - Cannot reach the website"
-        except requests.exceptions.Timeout:
+        except asyncio.TimeoutError:
             return None, f"Timeout error - Website took too long to respond"
-        except requests.exceptions.RequestException as e:
+        except aiohttp.ClientError as e:
             return None, f"Request error: {str(e)}"
         except Exception as e:
             return None, f"Unexpected error: {str(e)}"
     
-    async def send_notification(self, chat_id, product_name, is_in_stock, message, product_url):
-        """Send Telegram notification"""
+    def format_stock_update(self, product_name, is_in_stock, message, product_url):
+        """Format a single product's stock update"""
+        template = _IN_STOCK_TMPL if is_in_stock else _OUT_OF_STOCK_TMPL
+        return template.format_map({'name': product_name, 'msg': message, 'url': product_url})
+    
+    async def send_notification(self, chat_id, product_name, update_text):
+        """Queue a formatted stock update to be sent with the next flush"""
         # Skip if in dev mode and not the dev user
         if self.dev_mode and str(chat_id) != str(self.dev_user_id):
-            print(f"🔧 Dev mode: Skipping notification to {chat_id} for {product_name}")
+            log.info("🔧 Dev mode: Skipping notification to %s for %s", chat_id, product_name)
             return
-            
-        status_emoji = "🟢" if is_in_stock else "🔴"
-        status_text = "In Stock" if is_in_stock else "Out of Stock"
-        
-        # Format message for better readability
-        if is_in_stock:
-            notification = (
-                f"🍵 *Matcha Stock Update*\n\n"
-                f"*{product_name}*\n"
-                f"Status: {status_emoji} {status_text}\n"
-                f"Details: {message}\n\n"
-                f"Check it out: {product_url}"
-            )
-        else:
-            # For out of stock, emphasize the restocking message
-            notification = (
-                f"🍵 *Matcha Stock Update*\n\n"
-                f"*{product_name}*\n"
-                f"Status: {status_emoji} {status_text}\n"
-                f"📢 *Restocking Info:* {message}\n\n"
-                f"Check it out: {product_url}"
-            )
+        
+        self._pending_notifs.setdefault(chat_id, []).append((product_name, update_text))
+    
+    async def _send_stock_updates(self, chat_id, updates):
+        """Send one user's queued stock updates as a single message"""
+        notification = _STOCK_UPDATE_HEADER + "\n\n".join(text for _, text in updates)
+        product_names = ", ".join(name for name, _ in updates)
         
         try:
-            await self.bot.send_message(
+            await self._telegram_send(
                 chat_id=chat_id,
                 text=notification,
-                parse_mode='Markdown'
+                parse_mode='Markdown',
+                link_preview_options=_NO_LINK_PREVIEW
             )
-            print(f"📱 Notification sent to {chat_id} for {product_name}")
+            log.info("📱 Notification sent to %s for %s", chat_id, product_names)
         except Exception as e:
-            print(f"❌ Error sending notification to {chat_id}: {e}")
+            log.error("❌ Error sending notification to %s: %s", chat_id, e)
+        
+        # Only dequeue once the send was attempted, so a cancelled flush leaves the
+        # updates queued for the shutdown flush
+        if self._pending_notifs.get(chat_id) is updates:
+            del self._pending_notifs[chat_id]
+    
+    async def flush_notifications(self):
+        """Send all queued stock notifications concurrently, one message per user"""
+        await asyncio.gather(
+            *[self._send_stock_updates(chat_id, updates)
+              for chat_id, updates in list(self._pending_notifs.items())],
+            return_exceptions=True
+        )
+    
+    async def _telegram_send(self, **kwargs):
+        """Call bot.send_message within the concurrency and rate limits"""
+        async with self._inflight:
+            await self._bucket.consume()
+            return await self.bot.send_message(**kwargs)
     
     async def send_message(self, chat_id, message, parse_mode='Markdown'):
         """Send message to Telegram chat"""
         # Skip if in dev mode and not the dev user
         if self.dev_mode and str(chat_id) != str(self.dev_user_id):
-            print(f"🔧 Dev mode: Skipping message to {chat_id}")
+            log.info("🔧 Dev mode: Skipping message to %s", chat_id)
             return
             
         try:
-            await self.bot.send_message(
+            await self._telegram_send(
                 chat_id=chat_id,
                 text=message,
                 parse_mode=parse_mode
             )
         except Exception as e:
-            print(f"❌ Error sending message to {chat_id}: {e}")
+            log.error("❌ Error sending message to %s: %s", chat_id, e)
+    
+    async def _send_one(self, chat_id, text, label):
+        """Send a Markdown message to one chat, logging the outcome"""
+        try:
+            await self._telegram_send(
+                chat_id=chat_id,
+                text=text,
+                parse_mode='Markdown'
+            )
+            log.info("📱 %s sent to %s", label, chat_id)
+        except Exception as e:
+            log.error("❌ Error sending %s to %s: %s", label.lower(), chat_id, e)
+    
+    async def broadcast(self, chat_ids, text, label):
+        """Send the same message to many chats concurrently"""
+        await asyncio.gather(
+            *[self._send_one(chat_id, text, label) for chat_id in chat_ids],
+            return_exceptions=True
+        )
     
     async def notify_maintenance_start(self):
         """Notify all users that bot is going into maintenance"""
@@ -298,32 +851,28 @@ class NeedMoMatchaBot:
             # In dev mode, only notify the dev user
             if self.should_send_notification("maintenance_start", self.dev_user_id):
                 try:
-                    await self.bot.send_message(
+                    await self._telegram_send(
                         chat_id=self.dev_user_id,
                         text=maintenance_msg,
                         parse_mode='Markdown'
                     )
-                    print(f"📱 Dev mode: Maintenance notification sent to {self.dev_user_id}")
+                    log.info("📱 Dev mode: Maintenance notification sent to %s", self.dev_user_id)
                 except Exception as e:
-                    print(f"❌ Error sending maintenance notification to dev user: {e}")
+                    log.error("❌ Error sending maintenance notification to dev user: %s", e)
             else:
-                print(f"📱 Dev mode: Skipping maintenance notification (already in maintenance)")
+                log.info("📱 Dev mode: Skipping maintenance notification (already in maintenance)")
             return
         
         # In production mode, notify all users
+        recipients = []
         for chat_id in self.users:
-            if self.should_send_notification("maintenance_start", chat_id):
-                try:
-                    await self.bot.send_message(
-                        chat_id=chat_id,
-                        text=maintenance_msg,
-                        parse_mode='Markdown'
-                    )
-                    print(f"📱 Maintenance notification sent to {chat_id}")
-                except Exception as e:
-                    print(f"❌ Error sending maintenance notification to {chat_id}: {e}")
+            if self.should_send_notification("maintenance_start", chat_id, save=False):
+                recipients.append(chat_id)
             else:
-                print(f"📱 Skipping maintenance notification to {chat_id} (already in maintenance)")
+                log.info("📱 Skipping maintenance notification to %s (already in maintenance)", chat_id)
+        self.save_bot_states(recipients)
+        
+        await self.broadcast(recipients, maintenance_msg, "Maintenance notification")
     
     async def notify_maintenance_end(self):
         """Notify all users that bot has resumed"""
@@ -337,32 +886,28 @@ class NeedMoMatchaBot:
             # In dev mode, only notify the dev user
             if self.should_send_notification("maintenance_end", self.dev_user_id):
                 try:
-                    await self.bot.send_message(
+                    await self._telegram_send(
                         chat_id=self.dev_user_id,
                         text=resume_msg,
                         parse_mode='Markdown'
                     )
-                    print(f"📱 Dev mode: Resume notification sent to {self.dev_user_id}")
+                    log.info("📱 Dev mode: Resume notification sent to %s", self.dev_user_id)
                 except Exception as e:
-                    print(f"❌ Error sending resume notification to dev user: {e}")
+                    log.error("❌ Error sending resume notification to dev user: %s", e)
             else:
-                print(f"📱 Dev mode: Skipping resume notification (already resumed)")
+                log.info("📱 Dev mode: Skipping resume notification (already resumed)")
             return
         
         # In production mode, notify all users
+        recipients = []
         for chat_id in self.users:
-            if self.should_send_notification("maintenance_end", chat_id):
-                try:
-                    await self.bot.send_message(
-                        chat_id=chat_id,
-                        text=resume_msg,
-                        parse_mode='Markdown'
-                    )
-                    print(f"📱 Resume notification sent to {chat_id}")
-                except Exception as e:
-                    print(f"❌ Error sending resume notification to {chat_id}: {e}")
+            if self.should_send_notification("maintenance_end", chat_id, save=False):
+                recipients.append(chat_id)
             else:
-                print(f"📱 Skipping resume notification to {chat_id} (already resumed)")
+                log.info("📱 Skipping resume notification to %s (already resumed)", chat_id)
+        self.save_bot_states(recipients)
+        
+        await self.broadcast(recipients, resume_msg, "Resume notification")
     
     async def notify_dev_mode_enabled(self):
         """Notify dev user that dev mode is enabled (same as maintenance message)"""
@@ -377,16 +922,16 @@ class NeedMoMatchaBot:
             # Use the same state-based logic as other notifications
             if self.should_send_notification("dev_mode_enabled", self.dev_user_id):
                 try:
-                    await self.bot.send_message(
+                    await self._telegram_send(
                         chat_id=self.dev_user_id,
                         text=maintenance_msg,
                         parse_mode='Markdown'
                     )
-                    print(f"📱 Dev mode: Maintenance notification sent to {self.dev_user_id}")
+                    log.info("📱 Dev mode: Maintenance notification sent to %s", self.dev_user_id)
                 except Exception as e:
-                    print(f"❌ Error sending dev mode notification: {e}")
+                    log.error("❌ Error sending dev mode notification: %s", e)
             else:
-                print(f"📱 Dev mode: Skipping maintenance notification (already in maintenance)")
+                log.info("📱 Dev mode: Skipping maintenance notification (already in maintenance)")
 
     async def notify_unexpected_shutdown(self, error_message):
         """Notify all users that bot crashed unexpectedly"""
@@ -401,32 +946,23 @@ class NeedMoMatchaBot:
         if self.dev_mode:
             # In dev mode, only notify the dev user
             try:
-                await self.bot.send_message(
+                await self._telegram_send(
                     chat_id=self.dev_user_id,
                     text=crash_msg,
                     parse_mode='Markdown'
                 )
-                print(f"📱 Dev mode: Crash notification sent to {self.dev_user_id}")
+                log.info("📱 Dev mode: Crash notification sent to %s", self.dev_user_id)
             except Exception as e:
-                print(f"❌ Error sending crash notification to dev user: {e}")
+                log.error("❌ Error sending crash notification to dev user: %s", e)
             return
         
         # In production mode, notify all users
-        for chat_id in self.users:
-            try:
-                await self.bot.send_message(
-                    chat_id=chat_id,
-                    text=crash_msg,
-                    parse_mode='Markdown'
-                )
-                print(f"📱 Crash notification sent to {chat_id}")
-            except Exception as e:
-                print(f"❌ Error sending crash notification to {chat_id}: {e}")
+        await self.broadcast(list(self.users), crash_msg, "Crash notification")
     
     async def notify_product_error(self, chat_id, product_name, error_message):
         """Notify user about a product that can't be monitored"""
         if self.dev_mode and str(chat_id) != str(self.dev_user_id):
-            print(f"🔧 Dev mode: Skipping product error notification to {chat_id}")
+            log.info("🔧 Dev mode: Skipping product error notification to %s", chat_id)
             return
             
         error_msg = (
@@ -441,390 +977,442 @@ class NeedMoMatchaBot:
         )
         
         try:
-            await self.bot.send_message(
+            await self._telegram_send(
                 chat_id=chat_id,
                 text=error_msg,
                 parse_mode='Markdown'
             )
-            print(f"📱 Product error notification sent to {chat_id} for {product_name}")
+            log.info("📱 Product error notification sent to %s for %s", chat_id, product_name)
         except Exception as e:
-            print(f"❌ Error sending product error notification to {chat_id}: {e}")
+            log.error("❌ Error sending product error notification to %s: %s", chat_id, e)
     
 
     
     async def handle_command(self, chat_id, message_text):
-        """Handle Telegram commands from specific user"""
+        """Handle Telegram commands from specific user
+        
+        Handlers receive everything after the command as `args`.
+        """
         if message_text.startswith('/'):
-            command = message_text.split()[0].lower()
+            command, *rest = message_text.split(maxsplit=1)
             
-            if command == '/start':
-                # Add user if they don't exist
-                self.add_user(chat_id, "Telegram User")
-                await self.send_message(
-                    chat_id,
-                    "🍵 *Welcome to Need Mo Matcha Bot!*\n\n"
-                    "I monitor Ippodo Tea matcha products (ippodotea.com) for stock changes.\n\n"
-                    "*Default Setup:* You're monitoring **Ikuyo 100g**\n\n"
-                    "*Commands:*\n"
-                    "📋 `/list` - Show all products\n"
-                    "📊 `/status` - Show your monitored products\n"
-                    "➕ `/add <product_id>` - Add product to monitoring\n"
-                    "➖ `/remove <product_id>` - Remove product\n"
-                    "🔄 `/default` - Reset to default\n"
-                    "❓ `/help` - Show help\n\n"
-                    "*To pause notifications:* Mute this chat in Telegram\n\n"
-                    "*Example:* `/add sayaka_40g`"
-                )
+            handler = self._cmds.get(command.lower())
+            if handler:
+                await handler(chat_id, rest[0] if rest else '')
+    
+    async def _cmd_start(self, chat_id, args):
+        """Register the user and send the welcome message"""
+        # Add user if they don't exist
+        self.add_user(chat_id, "Telegram User")
+        await self.send_message(
+            chat_id,
+            "🍵 *Welcome to Need Mo Matcha Bot!*\n\n"
+            "I monitor Ippodo Tea matcha products (ippodotea.com) for stock changes.\n\n"
+            "*Default Setup:* You're monitoring **Ikuyo 100g**\n\n"
+            "*Commands:*\n"
+            "📋 `/list` - Show all products\n"
+            "📊 `/status` - Show your monitored products\n"
+            "➕ `/add <product_id>` - Add product to monitoring\n"
+            "➖ `/remove <product_id>` - Remove product\n"
+            "🔄 `/default` - Reset to default\n"
+            "❓ `/help` - Show help\n\n"
+            "*To pause notifications:* Mute this chat in Telegram\n\n"
+            "*Example:* `/add sayaka_40g`"
+        )
+    
+    async def _cmd_list(self, chat_id, args):
+        """Show all available products"""
+        user_products = set(self.users.get(chat_id, {}).get('monitored_products', []))
+        
+        product_list = "📋 *Available Matcha Products:*\n\n" + "".join(
+            ("✅" if product_id in user_products else "❌") + line
+            for product_id, line in self._list_base_lines
+        ) + self._list_footer
+        
+        await self.send_message(chat_id, product_list)
+    
+    async def _cmd_status(self, chat_id, args):
+        """Show the user's monitored products"""
+        if chat_id not in self.users:
+            await self.send_message(chat_id, "❌ You're not registered. Use /start to begin.")
+            return
+        
+        user_products = self.users[chat_id].get('monitored_products', [])
+        if not user_products:
+            status_msg = "📊 *Your Monitoring Status:*\n\n"
+            status_msg += "❌ *No products currently being monitored*\n\n"
+            status_msg += "Use `/add <product_id>` to start monitoring a product.\n"
+            status_msg += "Use `/list` to see all available products.\n"
+            status_msg += "Use `/default` to reset to default (Ikuyo 100g only)."
+            await self.send_message(chat_id, status_msg)
+        else:
+            status_msg = f"📊 *Your Monitoring Status:*\n\n"
+            status_msg += f"Currently monitoring **{len(user_products)}** product(s):\n\n"
             
-            elif command == '/list':
-                product_list = "📋 *Available Matcha Products:*\n\n"
-                user_products = self.users.get(chat_id, {}).get('monitored_products', [])
-                
-                # Define the order based on website layout (RICH, MEDIUM, LIGHT)
-                product_order = [
-                    'ummon_40g', 'ummon_20g',  # RICH
-                    'sayaka_100g', 'sayaka_40g', 'horai_20g',  # RICH
-                    'kan_30g',  # MEDIUM
-                    'ikuyo_100g', 'ikuyo_30g',  # MEDIUM
-                    'wakaki_40g'  # LIGHT
-                ]
-                
-                for product_id in product_order:
-                    if product_id in self.config['available_products']:
-                        product_info = self.config['available_products'][product_id]
-                        status = "✅" if product_id in user_products else "❌"
-                        product_list += f"{status} `{product_id}` - {product_info['name']}\n"
-                
-                product_list += "\n*Legend:*\n"
-                product_list += "✅ = Currently being monitored\n"
-                product_list += "❌ = Not being monitored\n\n"
-                product_list += "*To add a product:* `/add <product_id>`\n"
-                product_list += "*To remove a product:* `/remove <product_id>`"
-                
-                await self.send_message(chat_id, product_list)
+            for product_id in user_products:
+                if product_id in self.config['available_products']:
+                    status_msg += f"✅ {self.config['available_products'][product_id]['name']}\n"
             
-            elif command == '/status':
-                if chat_id not in self.users:
-                    await self.send_message(chat_id, "❌ You're not registered. Use /start to begin.")
-                    return
-                
-                user_products = self.users[chat_id].get('monitored_products', [])
-                if not user_products:
-                    status_msg = "📊 *Your Monitoring Status:*\n\n"
-                    status_msg += "❌ *No products currently being monitored*\n\n"
-                    status_msg += "Use `/add <product_id>` to start monitoring a product.\n"
-                    status_msg += "Use `/list` to see all available products.\n"
-                    status_msg += "Use `/default` to reset to default (Ikuyo 100g only)."
-                    await self.send_message(chat_id, status_msg)
-                else:
-                    status_msg = f"📊 *Your Monitoring Status:*\n\n"
-                    status_msg += f"Currently monitoring **{len(user_products)}** product(s):\n\n"
-                    
-                    for product_id in user_products:
-                        if product_id in self.config['available_products']:
-                            status_msg += f"✅ {self.config['available_products'][product_id]['name']}\n"
-                    
-                    status_msg += "\n*To add more products:* `/add <product_id>`\n"
-                    status_msg += "*To remove products:* `/remove <product_id>`\n"
-                    status_msg += "*To see all products:* `/list`"
-                    
-                    await self.send_message(chat_id, status_msg)
+            status_msg += "\n*To add more products:* `/add <product_id>`\n"
+            status_msg += "*To remove products:* `/remove <product_id>`\n"
+            status_msg += "*To see all products:* `/list`"
             
-            elif command == '/add':
-                if chat_id not in self.users:
-                    await self.send_message(chat_id, "❌ You're not registered. Use /start to begin.")
-                    return
-                
-                parts = message_text.split()
-                if len(parts) < 2:
-                    await self.send_message(
-                        chat_id, 
-                        "❌ *Missing Product ID*\n\n"
-                        "Please specify which product to add.\n\n"
-                        "*Example:* `/add sayaka_40g`\n"
-                        "*To add all products:* `/add all`\n"
-                        "*To see all products:* `/list`"
-                    )
-                    return
-                
-                product_id = parts[1]
-                
-                # Handle "all" command
-                if product_id.lower() == 'all':
-                    all_products = list(self.config['available_products'].keys())
-                    user_products = self.users[chat_id].get('monitored_products', [])
-                    
-                    # Add all products that aren't already being monitored
-                    added_products = []
-                    for product in all_products:
-                        if product not in user_products:
-                            user_products.append(product)
-                            added_products.append(product)
-                    
-                    if added_products:
-                        self.update_user_preferences(chat_id, user_products)
-                        await self.send_message(
-                            chat_id, 
-                            f"✅ *Added all products to monitoring*\n\n"
-                            f"Added **{len(added_products)}** new product(s).\n"
-                            f"You're now monitoring **{len(user_products)}** total product(s).\n\n"
-                            f"Use `/status` to see all your monitored products.\n"
-                            f"Use `/list` to see all available products."
-                        )
-                    else:
-                        await self.send_message(
-                            chat_id, 
-                            "ℹ️ *Already Monitoring All*\n\n"
-                            f"You're already monitoring all **{len(user_products)}** available products.\n\n"
-                            f"Use `/status` to see all your monitored products.\n"
-                            f"Use `/list` to see all available products."
-                        )
-                    return
-                
-                # Handle individual product
-                if product_id not in self.config['available_products']:
-                    await self.send_message(
-                        chat_id, 
-                        f"❌ *Product Not Found*\n\n"
-                        f"`{product_id}` is not a valid product ID.\n\n"
-                        f"*To see all available products:* `/list`\n"
-                        f"*To add all products:* `/add all`\n"
-                        f"*Example valid IDs:* `sayaka_40g`, `ummon_20g`, `kan_30g`"
-                    )
-                    return
-                
-                user_products = self.users[chat_id].get('monitored_products', [])
-                if product_id in user_products:
-                    await self.send_message(
-                        chat_id, 
-                        f"ℹ️ *Already Monitoring*\n\n"
-                        f"`{product_id}` is already in your monitoring list.\n\n"
-                        f"Use `/status` to see all your monitored products.\n"
-                        f"Use `/list` to see all available products."
-                    )
-                    return
-                
-                user_products.append(product_id)
+            await self.send_message(chat_id, status_msg)
+    
+    async def _cmd_add(self, chat_id, args):
+        """Add a product (or all products) to monitoring"""
+        if chat_id not in self.users:
+            await self.send_message(chat_id, "❌ You're not registered. Use /start to begin.")
+            return
+        
+        parts = args.split()
+        if not parts:
+            await self.send_message(
+                chat_id, 
+                "❌ *Missing Product ID*\n\n"
+                "Please specify which product to add.\n\n"
+                "*Example:* `/add sayaka_40g`\n"
+                "*To add all products:* `/add all`\n"
+                "*To see all products:* `/list`"
+            )
+            return
+        
+        product_id = parts[0]
+        
+        # Handle "all" command
+        if product_id.lower() == 'all':
+            all_products = list(self.config['available_products'].keys())
+            user_products = self.users[chat_id].get('monitored_products', [])
+            
+            # Add all products that aren't already being monitored
+            added_products = []
+            for product in all_products:
+                if product not in user_products:
+                    user_products.append(product)
+                    added_products.append(product)
+            
+            if added_products:
                 self.update_user_preferences(chat_id, user_products)
                 await self.send_message(
                     chat_id, 
-                    f"✅ *Added to monitoring:* `{product_id}`\n\n"
-                    f"You're now monitoring **{len(user_products)}** product(s).\n"
+                    f"✅ *Added all products to monitoring*\n\n"
+                    f"Added **{len(added_products)}** new product(s).\n"
+                    f"You're now monitoring **{len(user_products)}** total product(s).\n\n"
                     f"Use `/status` to see all your monitored products.\n"
                     f"Use `/list` to see all available products."
                 )
-            
-            elif command == '/remove':
-                if chat_id not in self.users:
-                    await self.send_message(chat_id, "❌ You're not registered. Use /start to begin.")
-                    return
-                
-                parts = message_text.split()
-                if len(parts) < 2:
-                    await self.send_message(
-                        chat_id, 
-                        "❌ *Missing Product ID*\n\n"
-                        "Please specify which product to remove.\n\n"
-                        "*Example:* `/remove sayaka_40g`\n"
-                        "*To see your monitored products:* `/status`"
-                    )
-                    return
-                
-                product_id = parts[1]
-                user_products = self.users[chat_id].get('monitored_products', [])
-                if product_id not in user_products:
-                    await self.send_message(
-                        chat_id, 
-                        f"❌ *Not Being Monitored*\n\n"
-                        f"`{product_id}` is not in your monitoring list.\n\n"
-                        f"Use `/status` to see your currently monitored products.\n"
-                        f"Use `/list` to see all available products."
-                    )
-                    return
-                
-                user_products = [p for p in user_products if p != product_id]
-                self.update_user_preferences(chat_id, user_products)
-                
-                if user_products:
-                    await self.send_message(
-                        chat_id, 
-                        f"✅ *Removed from monitoring:* `{product_id}`\n\n"
-                        f"You're now monitoring **{len(user_products)}** product(s).\n"
-                        f"Use `/status` to see all your monitored products.\n"
-                        f"Use `/list` to see all available products."
-                    )
-                else:
-                    await self.send_message(
-                        chat_id, 
-                        f"✅ *Removed from monitoring:* `{product_id}`\n\n"
-                        f"❌ *No products currently being monitored*\n\n"
-                        f"Use `/add <product_id>` to start monitoring a product.\n"
-                        f"Use `/default` to reset to default (Ikuyo 100g only)."
-                    )
-            
-            elif command == '/default':
-                if chat_id not in self.users:
-                    await self.send_message(chat_id, "❌ You're not registered. Use /start to begin.")
-                    return
-                
-                self.update_user_preferences(chat_id, ['ikuyo_100g'])
+            else:
                 await self.send_message(
                     chat_id, 
-                    "🔄 *Reset to Default*\n\n"
-                    "✅ You're now monitoring **Ikuyo 100g** only.\n\n"
-                    "Use `/add <product_id>` to add more products.\n"
-                    "Use `/list` to see all available products.\n"
-                    "Use `/status` to see your current monitoring."
-                )
-            
-            elif command == '/help':
-                await self.send_message(
-                    chat_id,
-                    "🍵 *Need Mo Matcha Bot Help*\n\n"
-                    "I monitor Ippodo Tea matcha products (ippodotea.com) for stock changes.\n\n"
-                    "*I'll send you notifications when:*\n"
-                    "• Products come back in stock 🟢\n"
-                    "• Products go out of stock 🔴\n"
-                    "• Restocking messages change (e.g., \"back in 3 days\" or \"restocking weekly\")\n\n"
-                    "*Commands:*\n"
-                    "📋 `/list` - Show all products\n"
-                    "📊 `/status` - Show your monitored products\n"
-                    "➕ `/add <product_id>` - Add product to monitoring\n"
-                    "➖ `/remove <product_id>` - Remove product\n"
-                    "🔄 `/default` - Reset to default\n"
-                    "❓ `/help` - Show this help\n\n"
-                    "*To pause notifications:* Mute this chat in Telegram\n\n"
-                    "*Examples:*\n"
-                    "`/add sayaka_40g` - Monitor Sayaka 40g\n"
-                    "`/remove ummon_20g` - Stop monitoring Ummon 20g\n\n"
-                    "*Available Products:*\n"
-                    "• **Ummon** - `ummon_40g`, `ummon_20g`\n"
-                    "• **Sayaka** - `sayaka_100g`, `sayaka_40g`\n"
-                    "• **Horai** - `horai_20g`\n"
-                    "• **Kan** - `kan_30g`\n"
-                    "• **Ikuyo** - `ikuyo_100g`, `ikuyo_30g`\n"
-                    "• **Wakaki** - `wakaki_40g`"
+                    "ℹ️ *Already Monitoring All*\n\n"
+                    f"You're already monitoring all **{len(user_products)}** available products.\n\n"
+                    f"Use `/status` to see all your monitored products.\n"
+                    f"Use `/list` to see all available products."
                 )
+            return
+        
+        # Handle individual product
+        if product_id not in self.config['available_products']:
+            await self.send_message(
+                chat_id, 
+                f"❌ *Product Not Found*\n\n"
+                f"`{product_id}` is not a valid product ID.\n\n"
+                f"*To see all available products:* `/list`\n"
+                f"*To add all products:* `/add all`\n"
+                f"*Example valid IDs:* `sayaka_40g`, `ummon_20g`, `kan_30g`"
+            )
+            return
+        
+        user_products = self.users[chat_id].get('monitored_products', [])
+        if product_id in user_products:
+            await self.send_message(
+                chat_id, 
+                f"ℹ️ *Already Monitoring*\n\n"
+                f"`{product_id}` is already in your monitoring list.\n\n"
+                f"Use `/status` to see all your monitored products.\n"
+                f"Use `/list` to see all available products."
+            )
+            return
+        
+        user_products.append(product_id)
+        self.update_user_preferences(chat_id, user_products)
+        await self.send_message(
+            chat_id, 
+            f"✅ *Added to monitoring:* `{product_id}`\n\n"
+            f"You're now monitoring **{len(user_products)}** product(s).\n"
+            f"Use `/status` to see all your monitored products.\n"
+            f"Use `/list` to see all available products."
+        )
+    
+    async def _cmd_remove(self, chat_id, args):
+        """Remove a product from monitoring"""
+        if chat_id not in self.users:
+            await self.send_message(chat_id, "❌ You're not registered. Use /start to begin.")
+            return
+        
+        parts = args.split()
+        if not parts:
+            await self.send_message(
+                chat_id, 
+                "❌ *Missing Product ID*\n\n"
+                "Please specify which product to remove.\n\n"
+                "*Example:* `/remove sayaka_40g`\n"
+                "*To see your monitored products:* `/status`"
+            )
+            return
+        
+        product_id = parts[0]
+        user_products = self.users[chat_id].get('monitored_products', [])
+        if product_id not in user_products:
+            await self.send_message(
+                chat_id, 
+                f"❌ *Not Being Monitored*\n\n"
+                f"`{product_id}` is not in your monitoring list.\n\n"
+                f"Use `/status` to see your currently monitored products.\n"
+                f"Use `/list` to see all available products."
+            )
+            return
+        
+        user_products = [p for p in user_products if p != product_id]
+        self.update_user_preferences(chat_id, user_products)
+        self.invalidate_stock_status(chat_id)
+        
+        if user_products:
+            await self.send_message(
+                chat_id, 
+                f"✅ *Removed from monitoring:* `{product_id}`\n\n"
+                f"You're now monitoring **{len(user_products)}** product(s).\n"
+                f"Use `/status` to see all your monitored products.\n"
+                f"Use `/list` to see all available products."
+            )
+        else:
+            await self.send_message(
+                chat_id, 
+                f"✅ *Removed from monitoring:* `{product_id}`\n\n"
+                f"❌ *No products currently being monitored*\n\n"
+                f"Use `/add <product_id>` to start monitoring a product.\n"
+                f"Use `/default` to reset to default (Ikuyo 100g only)."
+            )
+    
+    async def _cmd_default(self, chat_id, args):
+        """Reset monitoring to the default product"""
+        if chat_id not in self.users:
+            await self.send_message(chat_id, "❌ You're not registered. Use /start to begin.")
+            return
+        
+        self.update_user_preferences(chat_id, ['ikuyo_100g'])
+        await self.send_message(
+            chat_id, 
+            "🔄 *Reset to Default*\n\n"
+            "✅ You're now monitoring **Ikuyo 100g** only.\n\n"
+            "Use `/add <product_id>` to add more products.\n"
+            "Use `/list` to see all available products.\n"
+            "Use `/status` to see your current monitoring."
+        )
+    
+    async def _cmd_help(self, chat_id, args):
+        """Show the help message"""
+        await self.send_message(
+            chat_id,
+            "🍵 *Need Mo Matcha Bot Help*\n\n"
+            "I monitor Ippodo Tea matcha products (ippodotea.com) for stock changes.\n\n"
+            "*I'll send you notifications when:*\n"
+            "• Products come back in stock 🟢\n"
+            "• Products go out of stock 🔴\n"
+            "• Restocking messages change (e.g., \"back in 3 days\" or \"restocking weekly\")\n\n"
+            "*Commands:*\n"
+            "📋 `/list` - Show all products\n"
+            "📊 `/status` - Show your monitored products\n"
+            "➕ `/add <product_id>` - Add product to monitoring\n"
+            "➖ `/remove <product_id>` - Remove product\n"
+            "🔄 `/default` - Reset to default\n"
+            "❓ `/help` - Show this help\n\n"
+            "*To pause notifications:* Mute this chat in Telegram\n\n"
+            "*Examples:*\n"
+            "`/add sayaka_40g` - Monitor Sayaka 40g\n"
+            "`/remove ummon_20g` - Stop monitoring Ummon 20g\n\n"
+            "*Available Products:*\n"
+            "• **Ummon** - `ummon_40g`, `ummon_20g`\n"
+            "• **Sayaka** - `sayaka_100g`, `sayaka_40g`\n"
+            "• **Horai** - `horai_20g`\n"
+            "• **Kan** - `kan_30g`\n"
+            "• **Ikuyo** - `ikuyo_100g`, `ikuyo_30g`\n"
+            "• **Wakaki** - `wakaki_40g`"
+        )
+    
+    def _schedule_next_check(self, product_id, is_in_stock, message, retry_after=0):
+        """Pick a product's next polling interval from its latest result"""
+        interval = self._poll_intervals.get(product_id, self.min_interval)
+        
+        # Errors keep the current interval; only valid results say whether the page changed
+        if is_in_stock is not None:
+            previous = self._last_seen.get(product_id)
+            self._last_seen[product_id] = (is_in_stock, message)
+            if previous is not None:
+                if previous != (is_in_stock, message):
+                    interval = max(self.min_interval, interval / 2)
+                else:
+                    interval = min(self.max_interval, interval * 2)
+        
+        self._poll_intervals[product_id] = interval
+        self._next_check[product_id] = time.monotonic() + max(interval, retry_after)
+    
+    def _seconds_until_next_check(self):
+        """Time until the next product is due, capped so new subscriptions are picked up quickly"""
+        now = time.monotonic()
+        next_due = min(
+            (self._next_check.get(product_id, 0) for product_id in self.product_subscribers),
+            default=now + self.min_interval
+        )
+        return min(self.min_interval, max(0, next_due - now))
     
     async def monitor_products(self):
         """Main monitoring loop for all users"""
-        print("🚀 Starting Need Mo Matcha Monitor...")
-        print(f"⏰ Checking every {self.config['monitoring']['check_interval']} seconds")
+        log.info("🚀 Starting Need Mo Matcha Monitor...")
+        log.info("⏰ Checking every %s-%s seconds depending on how often each product changes", self.min_interval, self.max_interval)
         
+        available = self.config['available_products']
         while True:
             try:
-                print(f"\n🕐 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Checking products...")
+                # Collect the products whose polling interval has elapsed
+                now = time.monotonic()
+                all_products_to_check = [
+                    product_id for product_id in self.product_subscribers
+                    if self._next_check.get(product_id, 0) <= now
+                ]
+                
+                if not all_products_to_check:
+                    if not self.product_subscribers:
+                        log.info("  ⏸️ No products to monitor - waiting...")
+                    await asyncio.sleep(self._seconds_until_next_check())
+                    continue
+                
+                # Wall-clock time sampled once per cycle, for logging and error throttling
+                cycle_now = time.time()
+                log.info("🕐 %s - Checking products...", time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(cycle_now)))
                 
                 # Track which products we've already checked this cycle
                 checked_products = {}
                 
-                # Collect all unique products to check
-                all_products_to_check = set()
-                for user_data in self.users.values():
-                    all_products_to_check.update(user_data.get('monitored_products', []))
+                log.info("  📦 Checking %s unique products...", len(all_products_to_check))
                 
-                if not all_products_to_check:
-                    print("  ⏸️ No products to monitor - waiting...")
-                    await asyncio.sleep(self.config['monitoring']['check_interval'])
-                    continue
+                # Group products by URL so each page is fetched once per cycle
+                products_by_url = {}
+                for product_id in all_products_to_check:
+                    products_by_url.setdefault(available[product_id]['url'], []).append(product_id)
                 
-                print(f"  📦 Checking {len(all_products_to_check)} unique products...")
+                # Check all unique URLs once, concurrently
+                urls = list(products_by_url)
+                results = await asyncio.gather(*[
+                    self.check_product_stock(product_ids[0], available[product_ids[0]])
+                    for product_ids in products_by_url.values()
+                ], return_exceptions=True)
                 
-                # Check all unique products once
-                for product_id in all_products_to_check:
-                    if product_id in self.config['available_products']:
-                        product_config = self.config['available_products'][product_id]
-                        
-                        is_in_stock, message = await asyncio.get_event_loop().run_in_executor(None, self.check_product_stock, product_id, product_config)
+                # Share each result with every product pointing at the same URL
+                for url, result in zip(urls, results):
+                    if isinstance(result, BaseException):
+                        result = (None, f"Unexpected error: {str(result)}")
+                    is_in_stock, message = result
+                    retry_after = self._retry_after.pop(url, 0)
+                    for product_id in products_by_url[url]:
                         checked_products[product_id] = (is_in_stock, message)
+                        self._schedule_next_check(product_id, is_in_stock, message, retry_after)
                         
                         if is_in_stock is None:
-                            print(f"    ⚠️ {product_config['name']}: {message}")
+                            log.warning("    ⚠️ %s: %s", available[product_id]['name'], message)
                 
-                # Process results for each user
-                for chat_id, user_data in self.users.items():
-                    monitored_products = user_data.get('monitored_products', [])
-                    user_stock_status = self.get_user_stock_status(chat_id)
+                # Process each product's result for the users monitoring it
+                error_notifications = []
+                for product_id, (is_in_stock, message) in checked_products.items():
+                    product_config = available[product_id]
+                    persistent_error = is_in_stock is None and _PERSISTENT_ERROR_RE.search(message) is not None
+                    # The update text is the same for every subscriber, so it is formatted
+                    # once, when the first subscriber needs it
+                    update_text = None
+                    # Copy, since commands handled during an await may change subscriptions
+                    chat_ids = list(self.product_subscribers.get(product_id, ()))
                     
-                    print(f"  👤 Processing {user_data.get('name', 'Unknown')} ({len(monitored_products)} products)")
+                    log.info("  🍵 Processing %s (%s users)", product_config['name'], len(chat_ids))
                     
-                    for product_id in monitored_products:
-                        if product_id not in checked_products:
-                            continue
-                        
-                        is_in_stock, message = checked_products[product_id]
+                    for chat_id in chat_ids:
+                        user_stock_status = self.cached_stock_status(chat_id)
                         
                         if is_in_stock is not None:  # Only process if we got a valid result
-                            # Get previous status for this user
-                            previous_status = user_stock_status.get(product_id, None)
+                            # Get previous status for this user (legacy booleans were
+                            # converted to dicts when the JSON files were imported)
+                            prev = user_stock_status.get(product_id) or {}
+                            prev_in_stock = prev.get('in_stock')
+                            prev_message = prev.get('message', '')
                             
-                            # Check if status or message changed
-                            status_changed = False
-                            message_changed = False
+                            # Nothing to send or save when neither the status nor the message moved
+                            if (prev_in_stock, prev_message) == (is_in_stock, message):
+                                continue
                             
-                            if previous_status is not None:
-                                # Handle new format (dict with in_stock and message)
-                                if isinstance(previous_status, dict):
-                                    prev_in_stock = previous_status.get('in_stock')
-                                    prev_message = previous_status.get('message', '')
-                                    
-                                    status_changed = prev_in_stock != is_in_stock
-                                    message_changed = prev_message != message
-                                else:
-                                    # Handle legacy format (just boolean)
-                                    status_changed = previous_status != is_in_stock
-                                    message_changed = True  # Always notify on first run with new format
-                            else:
-                                # First check
-                                status_changed = True
-                                message_changed = True
+                            # A first check has no previous status, so both count as changed
+                            status_changed = prev_in_stock != is_in_stock
+                            message_changed = prev_message != message
                             
                             # Send notification if status or message changed
                             if status_changed:  # Only send notification if stock status changed
-                                if status_changed:
-                                    print(f"      🔄 Status changed: {previous_status.get('in_stock') if isinstance(previous_status, dict) else previous_status} → {is_in_stock}")
-                                if message_changed:
-                                    print(f"      📝 Message changed: {previous_status.get('message', 'N/A') if isinstance(previous_status, dict) else 'N/A'} → {message}")
+                                if log.isEnabledFor(logging.DEBUG):
+                                    if status_changed:
+                                        log.debug("      🔄 %s: Status changed: %s → %s", chat_id, prev_in_stock, is_in_stock)
+                                    if message_changed:
+                                        log.debug("      📝 %s: Message changed: %s → %s", chat_id, prev.get('message', 'N/A'), message)
                                 
-                                product_config = self.config['available_products'][product_id]
-                                await self.send_notification(
-                                    chat_id,
-                                    product_config['name'], 
-                                    is_in_stock, 
-                                    message, 
-                                    product_config['url']
-                                )
+                                if update_text is None:
+                                    update_text = self.format_stock_update(
+                                        product_config['name'], is_in_stock, message, product_config['url']
+                                    )
+                                await self.send_notification(chat_id, product_config['name'], update_text)
                             
                             # Update stored status for this user (only for valid results)
-                            user_stock_status[product_id] = {
-                                'in_stock': is_in_stock,
-                                'message': message
-                            }
+                            status = user_stock_status.setdefault(product_id, {})
+                            status['in_stock'] = is_in_stock
+                            status['message'] = message
+                            self._dirty_statuses.setdefault(chat_id, {})[product_id] = status
                         else:
                             # Handle error case (is_in_stock is None)
-                            print(f"      ⚠️ Error checking {product_id}: {message}")
+                            log.warning("      ⚠️ Error checking %s for %s: %s", product_id, chat_id, message)
                             
                             # Check if this is a persistent error (product removed/changed)
-                            if "not found" in message.lower() or "404" in message or "removed" in message.lower():
+                            if persistent_error:
                                 # Only notify once per day to avoid spam
-                                last_error_time = user_stock_status.get(f"{product_id}_error_time", 0)
-                                current_time = datetime.now().timestamp()
+                                status = user_stock_status.setdefault(product_id, {})
+                                last_error_time = status.get('error_time', 0)
                                 
-                                if current_time - last_error_time > 86400:  # 24 hours
-                                    product_config = self.config['available_products'][product_id]
-                                    await self.notify_product_error(chat_id, product_config['name'], message)
-                                    user_stock_status[f"{product_id}_error_time"] = current_time
-                    
-                    # Save user's stock status
-                    self.save_user_stock_status(chat_id, user_stock_status)
+                                if cycle_now - last_error_time > 86400:  # 24 hours
+                                    error_notifications.append(
+                                        self.notify_product_error(chat_id, product_config['name'], message)
+                                    )
+                                    status['error_time'] = cycle_now
+                                    self._dirty_statuses.setdefault(chat_id, {})[product_id] = status
                 
-                print(f"  💾 All user statuses saved. Waiting {self.config['monitoring']['check_interval']} seconds...")
-                await asyncio.sleep(self.config['monitoring']['check_interval'])
+                # Send the queued stock updates and product error notifications before
+                # saving the statuses behind them, so a send interrupted by a restart is
+                # detected and sent again
+                _, *results = await asyncio.gather(
+                    self.flush_notifications(), *error_notifications, return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        log.error("❌ Error sending product error notification: %s", result)
+                
+                # Save stock status only for users whose status changed this cycle
+                await self.save_dirty_stock_statuses()
+                
+                self._consecutive_errors = 0
+                delay = self._seconds_until_next_check()
+                log.info("  💾 All user statuses saved. Waiting %.0f seconds...", delay)
+                await asyncio.sleep(delay)
                 
             except Exception as e:
-                print(f"💥 Error in monitoring loop: {e}")
-                # Continue monitoring despite errors
-                await asyncio.sleep(30)  # Wait a bit longer before retrying
+                # Continue monitoring despite errors, backing off exponentially (with
+                # jitter) while they keep happening
+                self._consecutive_errors += 1
+                delay = min(300, 2 ** self._consecutive_errors) + random.uniform(0, 5)
+                log.error("💥 Error in monitoring loop: %s (retrying in %.0f seconds)", e, delay)
+                await asyncio.sleep(delay)
 
 async def handle_message(update: Update, bot_instance):
     """Handle incoming messages from Telegram"""
@@ -837,7 +1425,7 @@ async def handle_message(update: Update, bot_instance):
 async def main():
     bot = NeedMoMatchaBot()
     
-    print("🤖 Starting bot with message handling...")
+    log.info("🤖 Starting bot with message handling...")
     
     # Check if we should send startup notifications based on previous states
     if bot.dev_mode:
@@ -851,58 +1439,53 @@ async def main():
         
         if users_in_maintenance:
             # Only send resume notifications to users who were in maintenance
-            for chat_id in users_in_maintenance:
-                if bot.should_send_notification("maintenance_end", chat_id):
-                    try:
-                        resume_msg = (
-                            "✅ *Bot Resumed*\n\n"
-                            "The bot is back online and monitoring your products!\n\n"
-                            "You'll receive notifications for stock changes as usual."
-                        )
-                        await bot.bot.send_message(
-                            chat_id=chat_id,
-                            text=resume_msg,
-                            parse_mode='Markdown'
-                        )
-                        print(f"📱 Resume notification sent to {chat_id}")
-                    except Exception as e:
-                        print(f"❌ Error sending resume notification to {chat_id}: {e}")
+            resume_msg = (
+                "✅ *Bot Resumed*\n\n"
+                "The bot is back online and monitoring your products!\n\n"
+                "You'll receive notifications for stock changes as usual."
+            )
+            recipients = [chat_id for chat_id in users_in_maintenance
+                          if bot.should_send_notification("maintenance_end", chat_id, save=False)]
+            bot.save_bot_states(recipients)
+            await bot.broadcast(recipients, resume_msg, "Resume notification")
     
     # Start monitoring in the background
     monitoring_task = asyncio.create_task(bot.monitor_products())
     
     try:
-        # Simple polling loop for messages
-        offset = 0
+        # Simple long-polling loop for messages (only message updates are requested)
+        offset = bot.load_telegram_offset()
         while True:
             try:
-                updates = await bot.bot.get_updates(offset=offset, timeout=10)
+                updates = await bot.bot.get_updates(offset=offset, timeout=30, allowed_updates=['message'])
                 for update in updates:
                     if update.message and update.message.text:
                         await handle_message(update, bot)
                     offset = update.update_id + 1
+                if updates:
+                    bot.save_telegram_offset(offset)
             except asyncio.CancelledError:
-                print("🛑 Bot shutdown requested...")
+                log.info("🛑 Bot shutdown requested...")
                 break
             except KeyboardInterrupt:
-                print("🛑 KeyboardInterrupt caught in polling loop...")
+                log.info("🛑 KeyboardInterrupt caught in polling loop...")
                 break
             except Exception as e:
-                print(f"⚠️ Error in polling: {e}")
+                log.warning("⚠️ Error in polling: %s", e)
                 await asyncio.sleep(5)
     except KeyboardInterrupt:
-        print("🛑 Stopping bot...")
+        log.info("🛑 Stopping bot...")
     except Exception as e:
-        print(f"💥 Unexpected error: {e}")
+        log.error("💥 Unexpected error: %s", e)
         # Notify users about unexpected shutdown
         await bot.notify_unexpected_shutdown(str(e))
     finally:
         # Always try to send maintenance notification
         try:
-            print("📱 Sending maintenance notifications...")
+            log.info("📱 Sending maintenance notifications...")
             await bot.notify_maintenance_start()
         except Exception as e:
-            print(f"❌ Error sending maintenance notifications: {e}")
+            log.error("❌ Error sending maintenance notifications: %s", e)
         
         # Cancel monitoring when bot stops
         monitoring_task.cancel()
@@ -911,12 +1494,22 @@ async def main():
         except asyncio.CancelledError:
             pass
         
-        print("✅ Bot shutdown complete")
+        # Deliver any stock updates still waiting in the queue
+        try:
+            await bot.flush_notifications()
+        except Exception as e:
+            log.error("❌ Error flushing notifications: %s", e)
+        
+        await bot.close()
+        await bot.save_dirty_stock_statuses()
+        bot.close_database()
+        
+        log.info("✅ Bot shutdown complete")
 
 if __name__ == "__main__":
     try:
         asyncio.run(main()) 
     except KeyboardInterrupt:
-        print("🛑 Bot stopped by user")
+        log.info("🛑 Bot stopped by user")
     except Exception as e:
-        print(f"💥 Fatal error: {e}") 
\ No newline at end of file
+        log.error("💥 Fatal error: %s", e) 
\ No newline at end of file
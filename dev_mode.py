@@ -10,7 +10,18 @@ import sys
 import os
 from dotenv import load_dotenv
 
-def get_dev_user_id():
+# Use the libyaml C loader/dumper when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+def load_config():
+    """Read and parse config.yaml"""
+    with open('config.yaml', 'r') as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+def get_dev_user_id(config=None):
     """Get dev user ID from environment variable or config file"""
     load_dotenv()
     
@@ -19,10 +30,10 @@ def get_dev_user_id():
     if env_user_id:
         return env_user_id
     
-    # Fallback to config file
+    # Fallback to config file, reusing it if the caller already loaded it
     try:
-        with open('config.yaml', 'r') as f:
-            config = yaml.safe_load(f)
+        if config is None:
+            config = load_config()
         return config.get('development', {}).get('dev_user_id')
     except FileNotFoundError:
         return None
@@ -31,8 +42,7 @@ def update_dev_mode(enabled, dev_user_id=None):
     """Update the development mode settings in config.yaml"""
     
     # Read current config
-    with open('config.yaml', 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_config()
     
     # Update development settings
     if 'development' not in config:
@@ -40,7 +50,7 @@ def update_dev_mode(enabled, dev_user_id=None):
     
     # If enabling and no user_id provided, try to get existing one
     if enabled and not dev_user_id:
-        existing_user_id = get_dev_user_id()
+        existing_user_id = get_dev_user_id(config)
         if existing_user_id:
             dev_user_id = existing_user_id
             print(f"📱 Using existing dev user ID: {dev_user_id}")
@@ -56,7 +66,7 @@ def update_dev_mode(enabled, dev_user_id=None):
     
     # Write updated config
     with open('config.yaml', 'w') as f:
-        yaml.dump(config, f, default_flow_style=False, sort_keys=False)
+        yaml.dump(config, f, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
     
     status = "enabled" if enabled else "disabled"
     print(f"✅ Development mode {status}")
@@ -68,8 +78,7 @@ def update_dev_mode(enabled, dev_user_id=None):
 def show_status():
     """Show current development mode status"""
     try:
-        with open('config.yaml', 'r') as f:
-            config = yaml.safe_load(f)
+        config = load_config()
     except FileNotFoundError:
         print("❌ config.yaml not found")
         return
@@ -78,7 +87,7 @@ def show_status():
     enabled = dev_config.get('enabled', False)
     
     # Get dev user ID from environment or config
-    dev_user_id = get_dev_user_id() or 'Not set'
+    dev_user_id = get_dev_user_id(config) or 'Not set'
     
     print(f"🔧 Development Mode: {'✅ Enabled' if enabled else '❌ Disabled'}")
     if enabled:
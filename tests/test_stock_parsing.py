@@ -0,0 +1,122 @@
+import asyncio
+import os
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+
+from bot import NeedMoMatchaBot, _fast_stock_status, _parse_product_page
+
+HEAD = b'<html><head><title>Ikuyo - Ippodo Tea</title></head><body>'
+TAIL = b'</body></html>'
+
+# name -> (page body, whether the fast path should answer it without the full parse;
+# None when either answering correctly or falling back is fine)
+PAGES = {
+    'in_stock': (
+        b'<div class="product add-button-container">\n'
+        b'  <span class="product-stock-status">Add to bag</span></div>',
+        True,
+    ),
+    'sold_out': (
+        b'<div class="add-button-container"><span class="product-stock-status">Sold &amp; out</span></div>',
+        True,
+    ),
+    'unknown_status': (
+        b'<div class="add-button-container"><span class="product-stock-status">Coming soon</span></div>',
+        True,
+    ),
+    'out_of_stock_container': (
+        b'<div id="oos-container">Restocking <b>next week</b></div>'
+        b'<div class="add-button-container"><span class="product-stock-status">Add to bag</span></div>',
+        True,
+    ),
+    'status_span_with_markup': (
+        b'<div class="add-button-container"><span class="product-stock-status"><em>Sold</em> out</span></div>'
+        b'<div class="related"><span class="product-stock-status">Add to bag</span></div>',
+        False,
+    ),
+    'class_name_in_style': (
+        b'<style>.add-button-container { margin: 0 }</style>'
+        b'<span class="product-stock-status">Sold out</span>'
+        b'<div class="add-button-container"><span class="product-stock-status">Add to bag</span></div>',
+        True,
+    ),
+    'container_in_script': (
+        b'<script>var tmpl = \'<div class="add-button-container"><span class="product-stock-status">'
+        b'Sold out</span></div>\';</script>'
+        b'<div class="add-button-container"><span class="product-stock-status">Add to bag</span></div>',
+        False,
+    ),
+    'span_after_empty_container': (
+        b'<div class="add-button-container"></div><span class="product-stock-status">Add to bag</span>',
+        False,
+    ),
+    'span_nested_in_button': (
+        b'<div class="add-button-container"><button><span class="product-stock-status">Add to bag</span>'
+        b'</button></div>',
+        False,
+    ),
+    'oos_container_in_script': (
+        b'<script>var x = \'<div id="oos-container">Soon</div>\';</script>'
+        b'<div class="add-button-container"><span class="product-stock-status">Add to bag</span></div>',
+        False,
+    ),
+    'no_container': (b'<div class="product">Ikuyo</div>', False),
+    'prefixed_container_class': (
+        b'<div class="sticky-add-button-container"><span class="product-stock-status">Sold out</span></div>'
+        b'<div class="add-button-container"><span class="product-stock-status">Add to bag</span></div>',
+        None,
+    ),
+    'suffixed_container_class': (
+        b'<div class="add-button-container--mobile"><span class="product-stock-status">Sold out</span></div>'
+        b'<div class="add-button-container"><span class="product-stock-status">Add to bag</span></div>',
+        None,
+    ),
+    'suffixed_status_class': (
+        b'<div class="add-button-container"><span class="product-stock-status-label">Sold out</span>'
+        b'<span class="product-stock-status">Add to bag</span></div>',
+        None,
+    ),
+}
+
+
+class FastStockStatusTest(unittest.TestCase):
+    def test_fast_path_agrees_with_full_parse(self):
+        for name, (body, fast) in PAGES.items():
+            with self.subTest(name):
+                raw = HEAD + body + TAIL
+                result = _fast_stock_status(raw)
+                if fast is None:
+                    self.assertIn(result, (None, _parse_product_page(raw)))
+                elif fast:
+                    self.assertEqual(result, _parse_product_page(raw))
+                else:
+                    # Anything the fast path can't read must go to the full parse
+                    self.assertIsNone(result)
+
+    def test_error_page_falls_back(self):
+        raw = b'<html><head><title>404 Not Found</title></head><body></body></html>'
+        self.assertIsNone(_fast_stock_status(raw))
+        self.assertIsNone(_parse_product_page(raw)[0])
+
+
+class ParsePoolTest(unittest.TestCase):
+    def setUp(self):
+        # Only the parse pool is needed, so skip the full bot setup
+        self.bot = NeedMoMatchaBot.__new__(NeedMoMatchaBot)
+        self.bot.config = {'monitoring': {'parse_workers': 1}}
+        self.bot._parse_pool = self.bot._new_parse_pool()
+        self.addCleanup(lambda: self.bot._parse_pool.shutdown())
+
+    def test_dead_worker_replaces_pool(self):
+        raw = HEAD + PAGES['span_nested_in_button'][0] + TAIL
+        broken = self.bot._parse_pool
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+
+        result = asyncio.run(self.bot.parse_product_page(raw))
+        self.assertEqual(result, (True, 'In stock (Add to bag)'))
+        self.assertIsNot(self.bot._parse_pool, broken)
+
+
+if __name__ == '__main__':
+    unittest.main()